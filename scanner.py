@@ -1,10 +1,17 @@
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow.csv as pacsv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import glob
 import time
 from datetime import datetime, timedelta
 from io import BytesIO
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 # ──────────────────────────────────────────────────────────────
 # TELEGRAM (GitHub Secrets)
@@ -24,8 +31,45 @@ MIN_PRICE     = 100.0
 MAX_PRICE     = 2000.0
 MIN_VOLUME    = 50000
 
+PROBE_WORKERS = 4      # concurrent bhavcopy downloads (NSE rate-limits)
+TELEGRAM_GAP  = 0.5    # min seconds between messages to the same chat
+
+DEBUG         = os.environ.get("SCANNER_DEBUG") == "1"
+
+# Bhavcopy columns the scanner reads; the rest are skipped at parse time
+BHAV_COLUMNS  = ["SYMBOL", "SERIES", "OPEN", "HIGH", "LOW", "CLOSE", "TOTTRDQTY"]
+
+# Stored dtypes: prices stay float64 (float32 loses paise above
+# ₹131,072, e.g. MRF); VOLUME is int64 (the most heavily traded
+# counters can exceed 2**31 shares in a day)
+PRICE_COLUMNS = ["OPEN", "HIGH", "LOW", "CLOSE"]
+HISTORY_DTYPES = {**{c: "float64" for c in PRICE_COLUMNS}, "VOLUME": "int64"}
+
 DATA_DIR      = "data"
-HISTORY_FILE  = os.path.join(DATA_DIR, "history.csv")
+HISTORY_FILE  = os.path.join(DATA_DIR, "history.parquet")   # local cache, gitignored
+LEGACY_HISTORY_FILE = os.path.join(DATA_DIR, "history.csv")   # read once to migrate
+BHAV_DIR      = os.path.join(DATA_DIR, "bhav")   # one normalized Parquet file per day
+
+# ──────────────────────────────────────────────────────────────
+# HTTP SESSION (shared keep-alive pool for NSE + Telegram)
+# ──────────────────────────────────────────────────────────────
+
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 502, 503, 504],
+        raise_on_status=False,   # hand back the last response, callers check status_code
+    ),
+))
+SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "*/*",
+    "Connection": "keep-alive"
+})
 
 # ──────────────────────────────────────────────────────────────
 # NSE BHAVCOPY DOWNLOAD
@@ -48,38 +92,55 @@ def download_bhavcopy(date_obj):
     url = nse_bhavcopy_url(date_obj)
     print(f"📥 Downloading Bhavcopy: {url}")
 
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Accept": "*/*",
-        "Connection": "keep-alive"
-    }
-
-    r = requests.get(url, headers=headers, timeout=30)
+    try:
+        r = SESSION.get(url, timeout=30)
+    except requests.RequestException as e:
+        print(f"❌ Bhavcopy download failed: {e}")
+        return None
     if r.status_code != 200:
         return None
 
     try:
         z = zipfile.ZipFile(BytesIO(r.content))
         name = z.namelist()[0]
-        df = pd.read_csv(z.open(name))
-        return df
+
+        # pyarrow's multithreaded reader, limited to the columns we use
+        # (matched on stripped/upper-cased header names)
+        header = z.open(name).readline().decode("utf-8-sig").strip().split(",")
+        keep = [c for c in header if c.strip().upper() in BHAV_COLUMNS]
+        table = pacsv.read_csv(
+            z.open(name),
+            convert_options=pacsv.ConvertOptions(include_columns=keep),
+        )
+        return table.to_pandas()
     except Exception:
         return None
 
 
-def get_latest_bhavcopy(max_back_days=10):
+def get_latest_bhavcopy(max_back_days=10, after=None):
     """
     If today's file not available (holiday/weekend),
     it tries previous days up to max_back_days.
+    Candidate days are downloaded concurrently; the newest
+    day with a non-empty file wins.
+    Days on or before `after` (already in history) are not downloaded.
     """
-    for i in range(max_back_days):
-        d = datetime.utcnow() - timedelta(days=i)
-        print("DEBUG date:", d.strftime("%Y-%m-%d"))
-        df = download_bhavcopy(d)
-        if df is not None and len(df) > 0:
-            print(f"✅ Bhavcopy loaded for date: {d.strftime('%d %b %Y')}")
-            return df, d
-        time.sleep(1)
+    dates = [datetime.utcnow() - timedelta(days=i) for i in range(max_back_days)]
+    if after is not None:
+        dates = [d for d in dates if d.date() > after.date()]
+
+    pool = ThreadPoolExecutor(max_workers=PROBE_WORKERS)
+    try:
+        futures = [pool.submit(download_bhavcopy, d) for d in dates]
+        for d, fut in zip(dates, futures):
+            if DEBUG:
+                print("DEBUG date:", d.strftime("%Y-%m-%d"))
+            df = fut.result()
+            if df is not None and len(df) > 0:
+                print(f"✅ Bhavcopy loaded for date: {d.strftime('%d %b %Y')}")
+                return df, d
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
 
     return None, None
 
@@ -87,23 +148,66 @@ def get_latest_bhavcopy(max_back_days=10):
 # TELEGRAM
 # ──────────────────────────────────────────────────────────────
 
+def split_message(message, limit=4000, seps=("\n\n", "\n")):
+    """
+    Yields non-blank chunks of at most `limit` chars. Blank-line separated
+    blocks (one per breakout) are kept whole when they fit, so a result
+    never straddles two messages; a block longer than `limit` falls back
+    to line boundaries, and a single line longer than `limit` is
+    hard-sliced. Those fallbacks can still split an HTML tag that spans
+    lines or a sliced line. Chunks are produced lazily, one per send.
+    """
+    sep, finer = seps[0], seps[1:]
+    cur = None
+
+    for part in message.split(sep):
+        if len(part) > limit:
+            if cur is not None and cur.strip():
+                yield cur
+            cur = None
+            if finer:
+                yield from split_message(part, limit, finer)
+            else:
+                for i in range(0, len(part), limit):
+                    if part[i:i + limit].strip():
+                        yield part[i:i + limit]
+        elif cur is None:
+            cur = part
+        elif len(cur) + len(sep) + len(part) <= limit:
+            cur += sep + part
+        else:
+            if cur.strip():
+                yield cur
+            cur = part
+
+    if cur is not None and cur.strip():
+        yield cur
+
+
 def send_telegram(message):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("❌ Telegram credentials missing.")
         return
 
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    chunks = [message[i:i+4000] for i in range(0, len(message), 4000)]
+    last_sent = None
+
+    for chunk in split_message(message):
+        # Only wait out what is left of TELEGRAM_GAP since the last send
+        # (the POST itself usually uses most of it)
+        if last_sent is not None:
+            wait = TELEGRAM_GAP - (time.monotonic() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+        last_sent = time.monotonic()
 
-    for chunk in chunks:
         payload = {"chat_id": TELEGRAM_CHAT_ID, "text": chunk, "parse_mode": "HTML"}
         try:
-            r = requests.post(url, data=payload, timeout=20)
+            r = SESSION.post(url, data=payload, timeout=20)
             if r.status_code != 200:
                 print("❌ Telegram error:", r.text)
         except Exception as e:
             print("❌ Telegram failed:", e)
-        time.sleep(0.5)
 
 # ──────────────────────────────────────────────────────────────
 # HISTORY STORAGE
@@ -111,139 +215,246 @@ def send_telegram(message):
 
 def normalize_bhavcopy(df, date_obj):
     """
-    Bhavcopy columns typically:
-    SYMBOL, SERIES, OPEN, HIGH, LOW, CLOSE, LAST, PREVCLOSE,
-    TOTTRDQTY, TOTTRDVAL, TIMESTAMP, TOTALTRADES, ISIN
+    Takes the parsed BHAV_COLUMNS subset of a bhavcopy (the CSV reader
+    already drops LAST, PREVCLOSE, TOTTRDVAL, TIMESTAMP and the rest).
     """
-    df = df.copy()
-
-    df.columns = [c.strip().upper() for c in df.columns]
-
-    # Keep only EQ series
-    if "SERIES" in df.columns:
-        df = df[df["SERIES"] == "EQ"]
+    cols = {c.strip().upper(): c for c in df.columns}
 
-    df["DATE"] = date_obj.strftime("%Y-%m-%d")
-
-    out = df[["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "TOTTRDQTY"]].copy()
-    out.rename(columns={"TOTTRDQTY": "VOLUME"}, inplace=True)
+    # Keep only EQ series; filter + column pick in one .loc (a single copy)
+    rows = df[cols["SERIES"]] == "EQ" if "SERIES" in cols else slice(None)
+    out = df.loc[rows, [cols[c] for c in ["SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "TOTTRDQTY"]]]
+    out.columns = ["SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]
 
     # Ensure numeric
     for col in ["OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"]:
         out[col] = pd.to_numeric(out[col], errors="coerce")
 
-    out = out.dropna()
-    out["SYMBOL"] = out["SYMBOL"].astype(str).str.strip().str.upper()
+    out.dropna(inplace=True)
+    out = out.astype(HISTORY_DTYPES)
+    out["SYMBOL"] = out["SYMBOL"].astype(str).str.strip().str.upper().astype("category")
+    out.insert(0, "DATE", date_obj.strftime("%Y-%m-%d"))
 
     return out
 
 
 def load_history():
-    if not os.path.exists(HISTORY_FILE):
-        return pd.DataFrame(columns=["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"])
+    """
+    The committed record of history is the per-day files in data/bhav
+    (immutable, so git stores each one once). data/history.parquet is
+    only a local, gitignored cache of their concatenation: used when it
+    holds every day file, otherwise history is rebuilt from them.
+    The old history.csv is read once and split into day files to migrate it.
+    """
+    if os.path.exists(HISTORY_FILE):
+        # memory_map: pyarrow decodes straight from the page cache
+        # instead of first reading the file into its own buffer
+        history = pd.read_parquet(HISTORY_FILE, memory_map=True)
+
+        # A pull can bring in day files committed since the cache was
+        # written; trust it only if it holds every stored day
+        stored = {bhav_path_date(p) for p in bhav_day_paths()}
+        if stored <= set(history["DATE"].unique()):
+            return history
+        print("♻️ History cache is missing stored days")
+        return rebuild_history()
+
+    if os.path.exists(LEGACY_HISTORY_FILE):
+        df = pd.read_csv(LEGACY_HISTORY_FILE, dtype=HISTORY_DTYPES)
+        df["DATE"] = pd.to_datetime(df["DATE"])
+        for day, rows in df.groupby("DATE"):
+            if not os.path.exists(bhav_day_path(day)):
+                save_bhav_day(rows, day)
+        return df
 
-    df = pd.read_csv(HISTORY_FILE)
-    df["DATE"] = pd.to_datetime(df["DATE"])
-    return df
+    return rebuild_history()
 
 
 def save_history(df):
+    """
+    Writes the local history cache (not committed, see load_history).
+    """
     os.makedirs(DATA_DIR, exist_ok=True)
     df2 = df.copy()
-    df2["DATE"] = pd.to_datetime(df2["DATE"]).dt.strftime("%Y-%m-%d")
-    df2.to_csv(HISTORY_FILE, index=False)
+    df2["DATE"] = pd.to_datetime(df2["DATE"])
+    df2["SYMBOL"] = df2["SYMBOL"].astype("category").cat.remove_unused_categories()
+    df2 = df2.astype(HISTORY_DTYPES)
+    df2.to_parquet(HISTORY_FILE, compression="zstd", index=False)
 
+    # Migrated: its rows now live in data/bhav
+    if os.path.exists(LEGACY_HISTORY_FILE):
+        os.remove(LEGACY_HISTORY_FILE)
 
-def update_history(history, today_df):
-    """
-    Adds today's bhavcopy rows into history and removes duplicates.
-    """
-    today_df = today_df.copy()
-    today_df["DATE"] = pd.to_datetime(today_df["DATE"])
 
-    history = history.copy()
-    history["DATE"] = pd.to_datetime(history["DATE"])
+def bhav_day_path(date_obj):
+    return os.path.join(BHAV_DIR, date_obj.strftime("%Y-%m-%d") + ".parquet")
 
-    combined = pd.concat([history, today_df], ignore_index=True)
-    combined.drop_duplicates(subset=["DATE", "SYMBOL"], keep="last", inplace=True)
 
-    combined.sort_values(["SYMBOL", "DATE"], inplace=True)
-    return combined
+def bhav_path_date(path):
+    return pd.to_datetime(os.path.basename(path)[:-len(".parquet")])
 
-# ──────────────────────────────────────────────────────────────
-# INDICATORS
-# ──────────────────────────────────────────────────────────────
 
-def compute_ema(series, span):
-    return series.ewm(span=span, adjust=False).mean()
+def bhav_day_paths():
+    return sorted(glob.glob(os.path.join(BHAV_DIR, "*.parquet")))
 
 
-def scan_breakouts(history, scan_date_str):
+def save_bhav_day(today_df, date_obj):
     """
-    For each symbol:
-    - Use last LOOKBACK_DAYS bars before today to compute 52WH
-    - Use full bars to compute EMA21
+    Keeps each normalized bhavcopy as data/bhav/YYYY-MM-DD.parquet.
+    These files are what gets committed; history is rebuilt from them
+    from disk: no re-download, no CSV parse.
     """
-    results = []
+    os.makedirs(BHAV_DIR, exist_ok=True)
+    df = today_df.assign(DATE=pd.to_datetime(today_df["DATE"]))
+    df.to_parquet(bhav_day_path(date_obj), compression="zstd", index=False)
 
-    scan_date = pd.to_datetime(scan_date_str)
 
-    # Only symbols that have today's data
-    today_rows = history[history["DATE"] == scan_date]
-    symbols_today = today_rows["SYMBOL"].unique().tolist()
+def prune_bhav_days(cutoff):
+    """
+    Drops per-day files older than cutoff (same window as history).
+    """
+    for path in bhav_day_paths():
+        if bhav_path_date(path) < cutoff:
+            os.remove(path)
+
+
+def rebuild_history():
+    """
+    Rebuilds history from the per-day files in data/bhav.
+    Returns an empty history if there are none.
+    """
+    paths = bhav_day_paths()
+    if not paths:
+        return pd.DataFrame(columns=["DATE", "SYMBOL", "OPEN", "HIGH", "LOW", "CLOSE", "VOLUME"])
+
+    print(f"♻️ Rebuilding history from {len(paths)} stored bhavcopies")
+    # memory_map, as for the cache in load_history
+    return concat_history([pd.read_parquet(p, memory_map=True) for p in paths])
 
-    for sym in symbols_today:
-        df = history[history["SYMBOL"] == sym].sort_values("DATE")
 
-        if len(df) < LOOKBACK_DAYS + 30:
-            continue
+def concat_history(frames):
+    """
+    Concatenates history frames keeping SYMBOL categorical. pd.concat
+    falls back to plain strings when category sets differ, so every
+    frame is first recoded onto the union of their categories.
+    """
+    symbols = union_categoricals([f["SYMBOL"].astype("category") for f in frames], sort_categories=True)
+    dtype = pd.CategoricalDtype(symbols.categories)
+    return pd.concat([f.astype({"SYMBOL": dtype}) for f in frames], ignore_index=True)
+
+
+def update_history(history, today_df):
+    """
+    Adds today's bhavcopy rows into history, replacing any rows already
+    stored for that date. Rows are appended in date order instead of
+    re-sorting the whole table: scan_breakouts orders bars itself.
+    """
+    today_df = today_df.drop_duplicates(subset=["SYMBOL"], keep="last")
+    today_df = today_df.assign(DATE=pd.to_datetime(today_df["DATE"]))
 
-        # Today's row
-        today = df[df["DATE"] == scan_date]
-        if today.empty:
-            continue
-        today = today.iloc[0]
+    if history.empty:
+        return today_df.reset_index(drop=True)
 
-        today_close = float(today["CLOSE"])
-        today_open  = float(today["OPEN"])
-        today_high  = float(today["HIGH"])
-        today_low   = float(today["LOW"])
-        today_vol   = float(today["VOLUME"])
+    history = history[~history["DATE"].isin(today_df["DATE"].unique())]
+    return concat_history([history, today_df])
 
-        if today_close < MIN_PRICE or today_close > MAX_PRICE:
-            continue
-        if today_vol < MIN_VOLUME:
-            continue
+# ──────────────────────────────────────────────────────────────
+# INDICATORS
+# ──────────────────────────────────────────────────────────────
 
-        # previous LOOKBACK_DAYS bars excluding today
-        prev = df[df["DATE"] < scan_date].tail(LOOKBACK_DAYS)
-        if len(prev) < LOOKBACK_DAYS:
-            continue
+def compute_ema_last(close, starts, last, span):
+    """
+    Last value of the (adjust=False) EMA for each symbol block
+    close[starts[i]:last[i]+1], without building the full EMA series.
+    Unrolling e[t] = a*x[t] + (1-a)*e[t-1]:
+        ema = sum a*(1-a)^k * x[-1-k]  +  (1-a)^(n-1) * x[0]
+    where k = bars back from the last bar.
+    """
+    alpha = 2.0 / (span + 1)
+    bars = last - starts + 1
+    bars_back = np.repeat(last, bars) - np.arange(len(close))   # 0 = last bar
+    decay = (1 - alpha) ** bars_back
+    first_bar = bars_back == np.repeat(bars - 1, bars)
+    return np.add.reduceat(close * np.where(first_bar, decay, alpha * decay), starts)
 
-        week52_high = float(prev["HIGH"].max())
 
-        # EMA21 from closes (including today)
-        ema21 = float(compute_ema(df["CLOSE"], EMA_PERIOD).iloc[-1])
+def scan_breakouts(history, scan_date_str):
+    """
+    Evaluates every symbol at once on the long (SYMBOL, DATE) table:
+    - Use last LOOKBACK_DAYS bars before today to compute 52WH
+    - Use full bars to compute EMA21
+    Each symbol is a contiguous block after sorting, so the per-symbol
+    reductions run as NumPy reduceat calls on raw column arrays.
+    Only symbols passing all filters are turned into result dicts.
+    """
+    scan_date = pd.to_datetime(scan_date_str)
 
-        price_breakout = today_high > week52_high
-        green_candle   = today_close > today_open
-        above_ema      = today_close > ema21
+    # Only symbols that have today's data, with the cheap price/volume
+    # filters applied up front so the rest of history is cut to survivors
+    today_rows = history[history["DATE"] == scan_date]
+    liquid = (
+        today_rows["CLOSE"].between(MIN_PRICE, MAX_PRICE)
+        & (today_rows["VOLUME"] >= MIN_VOLUME)
+    )
+    symbols_today = today_rows.loc[liquid, "SYMBOL"].unique()
+
+    df = history[history["SYMBOL"].isin(symbols_today) & (history["DATE"] <= scan_date)]
+    if df.empty:
+        return []
+
+    # Symbols as integer category codes: sorting and block detection
+    # compare ints instead of Python strings
+    symbols = pd.Categorical(df["SYMBOL"])
+    order   = np.lexsort((df["DATE"].to_numpy(), symbols.codes))
+    codes   = symbols.codes[order]
+
+    opens  = df["OPEN"].to_numpy(dtype="float64")[order]
+    highs  = df["HIGH"].to_numpy(dtype="float64")[order]
+    lows   = df["LOW"].to_numpy(dtype="float64")[order]
+    closes = df["CLOSE"].to_numpy(dtype="float64")[order]
+    vols   = df["VOLUME"].to_numpy(dtype="float64")[order]
+
+    # Block boundaries: starts[i]..last[i] are the bars of symbol i
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    last   = np.r_[starts[1:], len(codes)] - 1
+    bars   = last - starts + 1
+
+    # previous LOOKBACK_DAYS bars excluding today: rows [win_start, last)
+    # reduceat over (win_start, last) index pairs reads only those windows
+    win_start   = np.maximum(starts, last - LOOKBACK_DAYS)
+    week52_high = np.maximum.reduceat(highs, np.c_[win_start, last].ravel())[::2]
+
+    # EMA21 from closes (including today)
+    ema21 = compute_ema_last(closes, starts, last, EMA_PERIOD)
+
+    today_close = closes[last]
+    today_open  = opens[last]
+    today_high  = highs[last]
+    today_low   = lows[last]
+    today_vol   = vols[last]
+
+    history_ok     = bars >= LOOKBACK_DAYS + 30
+    price_breakout = today_high > week52_high
+    green_candle   = today_close > today_open
+    above_ema      = today_close > ema21
+
+    mask = history_ok & price_breakout & green_candle & above_ema
 
-        if not (price_breakout and green_candle and above_ema):
-            continue
+    results = []
 
-        sl_price = today_low
-        sl_pct = round((today_close - sl_price) / today_close * 100, 2)
+    for i in np.flatnonzero(mask):
+        close    = float(today_close[i])
+        sl_price = float(today_low[i])
+        sl_pct = round((close - sl_price) / close * 100, 2)
 
-        target_price = round(today_close + 2 * (today_close - sl_price), 2)
+        target_price = round(close + 2 * (close - sl_price), 2)
         target_pct   = round(sl_pct * 2, 2)
 
         results.append({
-            "symbol": sym,
-            "close": round(today_close, 2),
-            "week52_high": round(week52_high, 2),
-            "ema21": round(ema21, 2),
-            "volume": int(today_vol),
+            "symbol": symbols.categories[codes[last[i]]],
+            "close": round(close, 2),
+            "week52_high": round(float(week52_high[i]), 2),
+            "ema21": round(float(ema21[i]), 2),
+            "volume": int(today_vol[i]),
             "sl_price": round(sl_price, 2),
             "sl_pct": sl_pct,
             "target_price": target_price,
@@ -256,27 +467,48 @@ def scan_breakouts(history, scan_date_str):
 # MAIN
 # ──────────────────────────────────────────────────────────────
 
+# One block per breakout, filled from a scan_breakouts result dict
+BREAKOUT_TEMPLATE = (
+    "──────────────────\n"
+    "📌 <b>{symbol}</b>\n"
+    "   Close    : ₹{close}\n"
+    "   52W High : ₹{week52_high}\n"
+    "   21 EMA   : ₹{ema21}\n"
+    "   Volume   : {volume}\n"
+    "   SL       : ₹{sl_price} (-{sl_pct}%)\n"
+    "   Target   : ₹{target_price} (+{target_pct}%)\n"
+)
+
+
 def run():
     print("\n" + "=" * 60)
     print("NSE Breakout Scanner (Bhavcopy Based)")
     print("=" * 60 + "\n")
 
-    bhav, bhav_date = get_latest_bhavcopy()
-    if bhav is None:
+    history = load_history()
+    last_date = history["DATE"].max() if len(history) else None
+
+    bhav, bhav_date = get_latest_bhavcopy(after=last_date)
+
+    if bhav is not None:
+        today_df = normalize_bhavcopy(bhav, bhav_date)
+        save_bhav_day(today_df, bhav_date)
+        history = update_history(history, today_df)
+
+        # Keep only last ~400 trading days for smaller file
+        cutoff = pd.to_datetime(bhav_date) - timedelta(days=600)
+        history = history[history["DATE"] >= cutoff]
+
+        save_history(history)
+        prune_bhav_days(cutoff)
+    elif last_date is not None and last_date >= datetime.utcnow() - timedelta(days=10):
+        # Re-run for a day already stored: scan it straight from history
+        bhav_date = last_date
+        print(f"♻️ No newer bhavcopy, using history for: {bhav_date.strftime('%d %b %Y')}")
+    else:
         print("❌ Could not download bhavcopy for last 10 days.")
         return
 
-    today_df = normalize_bhavcopy(bhav, bhav_date)
-
-    history = load_history()
-    history = update_history(history, today_df)
-
-    # Keep only last ~400 trading days for smaller file
-    cutoff = pd.to_datetime(bhav_date) - timedelta(days=600)
-    history = history[history["DATE"] >= cutoff]
-
-    save_history(history)
-
     scan_date_str = bhav_date.strftime("%Y-%m-%d")
     results = scan_breakouts(history, scan_date_str)
 
@@ -295,35 +527,20 @@ def run():
     # Sort by volume descending
     results.sort(key=lambda x: x["volume"], reverse=True)
 
-    send_telegram(
+    # Header, every result and the footer go out as one payload;
+    # send_telegram splits it into as few 4000-char messages as needed
+    lines = [
         f"🚀 <b>NSE Breakout Scanner — {today_str}</b>\n\n"
         f"<b>{len(results)} breakout(s) found</b>\n"
-        f"Sorted by volume ↓"
-    )
-    time.sleep(0.5)
-
-    for batch_start in range(0, len(results), 10):
-        batch = results[batch_start:batch_start + 10]
-        lines = []
-        for r in batch:
-            lines.append(
-                f"──────────────────\n"
-                f"📌 <b>{r['symbol']}</b>\n"
-                f"   Close    : ₹{r['close']}\n"
-                f"   52W High : ₹{r['week52_high']}\n"
-                f"   21 EMA   : ₹{r['ema21']}\n"
-                f"   Volume   : {r['volume']}\n"
-                f"   SL       : ₹{r['sl_price']} (-{r['sl_pct']}%)\n"
-                f"   Target   : ₹{r['target_price']} (+{r['target_pct']}%)\n"
-            )
-        send_telegram("\n".join(lines))
-        time.sleep(0.5)
-
-    send_telegram(
+        f"Sorted by volume ↓\n"
+    ]
+    lines.extend(BREAKOUT_TEMPLATE.format_map(r) for r in results)
+    lines.append(
         f"──────────────────\n"
         f"⚠️ <i>Scanner only. Always verify chart.\n"
         f"Enter only if price holds above breakout level next day.</i>"
     )
+    send_telegram("\n".join(lines))
 
 if __name__ == "__main__":
     run()